@@ -0,0 +1,184 @@
+"""Batch scoring of large dataset files.
+
+The input file (dataset format, the polarity column is ignored) is streamed by chunks,
+the chunks are scored in parallel by worker processes which load the model once, and
+the predicted label and class probabilities of each row are appended to the output
+file in the input order. An interrupted run can be continued with --resume.
+
+Usage: python batch_score.py --model ../data/teacher reviews.csv scores.tsv
+(the model is saved with Classifier.save(), see distill.py)
+"""
+import argparse
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pandas.errors import EmptyDataError
+
+from datatools import iter_dataset_chunks
+
+CLASSIFIERS = {
+    'mixed': 'classifier_mixed',
+    'student': 'classifier_student',
+}
+
+# each mixed worker loads spaCy and the full frWac embedding table (several GB)
+DEFAULT_MIXED_WORKERS = 2
+
+# the classifier loaded by each worker process
+classifier = None
+
+
+def load_classifier(model_type, model_path):
+    """Load the model once per worker process (on its first task)"""
+    global classifier
+    if classifier is None:
+        # one keras/tensorflow thread per worker: the parallelism comes from the processes
+        import tensorflow as tf
+        from keras import backend as K
+        K.set_session(tf.Session(config=tf.ConfigProto(
+            intra_op_parallelism_threads=1,
+            inter_op_parallelism_threads=1
+        )))
+        module = importlib.import_module(CLASSIFIERS[model_type])
+        classifier = module.Classifier()
+        classifier.load(model_path)
+    return classifier
+
+
+def model_classes(model_type, model_path):
+    """Returns the class labels of the model, in the order of its probabilities"""
+    return list(load_classifier(model_type, model_path).label_binarizer.classes_)
+
+
+def score_chunk(model_type, model_path, texts):
+    """Score a chunk of texts, returns the formatted output rows"""
+    classifier = load_classifier(model_type, model_path)
+    Y = classifier.predict_proba_on_data(texts)
+    labels = classifier.label_binarizer.inverse_transform(Y)
+    return ''.join(
+        "%s\t%s\n" % (label, '\t'.join('%.6f' % p for p in probs))
+        for label, probs in zip(labels, Y)
+    )
+
+
+def recover_output(filename):
+    """Count the complete rows already written in the output file (header included)
+    and drop the partially written last row, if any.
+    Returns the row count and the header (None for an empty file)
+    """
+    if not os.path.exists(filename):
+        return 0, None
+    count = 0
+    end = 0
+    header = None
+    with open(filename, 'rb+') as fp:
+        for line in fp:
+            if not line.endswith(b'\n'):
+                break
+            if header is None:
+                header = line.decode('utf-8')
+            count += 1
+            end += len(line)
+        fp.truncate(end)
+    return count, header
+
+
+def iter_records(infile, chunksize, offset):
+    """Read the input by chunks of records, skipping its first 'offset' records.
+    The records are counted after parsing (blank lines dropped, quoted fields joined),
+    so that they match the rows written in the output
+    """
+    try:
+        chunks = iter_dataset_chunks(infile, chunksize)
+    except EmptyDataError:
+        return
+    for chunk in chunks:
+        if offset >= len(chunk):
+            offset -= len(chunk)
+            continue
+        yield chunk.iloc[offset:]
+        offset = 0
+
+
+def batch_score(infile, outfile, model_type, model_path, chunksize, workers, resume):
+    # check the model in the parent, the workers could only report it once the pool is running
+    for ext in ('.h5', '.pkl'):
+        if not os.path.exists(model_path + ext):
+            raise FileNotFoundError("Model file not found: %s" % (model_path + ext))
+
+    written, previous_header = recover_output(outfile) if resume else (0, None)
+    # the first output row is the header
+    offset = max(written - 1, 0)
+
+    # a worker killed while scoring (e.g. by the OOM killer) makes every pending result
+    # raise BrokenProcessPool, instead of hanging like a multiprocessing.Pool would
+    executor = ProcessPoolExecutor(workers)
+    # bounded number of chunks in flight to keep the memory constant
+    max_pending = 2 * workers
+    pending = deque()
+    done = 0
+    start_time = time.perf_counter()
+
+    try:
+        # loads the model in a first worker, and reports a loading error before any scoring
+        header = "label\t%s\n" % '\t'.join(executor.submit(model_classes, model_type, model_path).result())
+        if previous_header is not None and previous_header != header:
+            raise ValueError("Cannot resume %s: its header %r does not match the model classes %r" % (
+                outfile, previous_header.strip(), header.strip()))
+        if offset:
+            print("Resuming from record %d" % offset, file=sys.stderr)
+
+        with open(outfile, 'a' if written else 'w', encoding='utf-8', newline='\n') as out:
+            if not written:
+                out.write(header)
+                out.flush()
+
+            def write_result(future):
+                nonlocal done
+                rows = future.result()
+                out.write(rows)
+                out.flush()
+                done += rows.count('\n')
+                elapsed = time.perf_counter() - start_time
+                print("  %d rows scored (%d total), %.1f rows/s" % (done, offset + done, done / elapsed), file=sys.stderr)
+
+            for chunk in iter_records(infile, chunksize, offset):
+                texts = list(chunk['text'].fillna('').astype(str))
+                pending.append(executor.submit(score_chunk, model_type, model_path, texts))
+                if len(pending) >= max_pending:
+                    write_result(pending.popleft())
+            while pending:
+                write_result(pending.popleft())
+        executor.shutdown()
+    except BaseException:
+        for future in pending:
+            future.cancel()
+        # stop the workers still scoring (the executor has no public terminate)
+        for process in list(executor._processes.values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+        raise
+    print("Scored %d rows in %.2f s." % (done, time.perf_counter() - start_time), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a dataset file by chunks with a saved classifier")
+    parser.add_argument('infile', help="input file (dataset format)")
+    parser.add_argument('outfile', help="output file: label and class probabilities for each input row")
+    parser.add_argument('--model', required=True, help="path of the saved model (without extension)")
+    parser.add_argument('--model-type', choices=sorted(CLASSIFIERS), default='mixed')
+    parser.add_argument('--chunksize', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: %d for the mixed model, one per CPU for the student)" % DEFAULT_MIXED_WORKERS)
+    parser.add_argument('--resume', action='store_true', help="continue an interrupted run from the last written row")
+    args = parser.parse_args()
+    if args.workers is None:
+        args.workers = min(DEFAULT_MIXED_WORKERS, os.cpu_count()) if args.model_type == 'mixed' else os.cpu_count()
+    # fresh worker processes: keras/tensorflow must not be inherited from a forked parent
+    multiprocessing.set_start_method('spawn')
+    batch_score(args.infile, args.outfile, args.model_type, args.model, args.chunksize, args.workers, args.resume)
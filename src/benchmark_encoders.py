@@ -0,0 +1,75 @@
+import time
+import numpy as np
+from keras import backend as K
+
+import classifier_mixed
+import classifier_embeddings
+from datatools import load_dataset
+from tester import set_reproducible, eval_list
+
+
+def benchmark_run(classifier, trainfile, devfile):
+    """Train the classifier once and measure its latency and accuracy on the dev set"""
+    start_time = time.perf_counter()
+    classifier.train(trainfile, devfile)
+    train_time = time.perf_counter() - start_time
+
+    devdf = load_dataset(devfile)
+    texts = devdf['text']
+
+    # split the prediction time between the text vectorization (spaCy) and the model itself
+    start_time = time.perf_counter()
+    X = classifier.vectorize(texts)
+    vectorize_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    Y = classifier.model.predict(X)
+    predict_time = time.perf_counter() - start_time
+
+    slabels = classifier.label_binarizer.inverse_transform(Y)
+    devacc = eval_list(devdf['polarity'], slabels)
+    return (devacc, train_time, vectorize_time * 1000 / len(texts), predict_time * 1000 / len(texts))
+
+
+def benchmark_encoder(classifier, encoder, trainfile, devfile, n):
+    """Train the classifier n times with the given sequence encoder.
+    A single run is too noisy on the dev set (the tensorflow initialization is not seeded),
+    so the accuracy is reported as mean and standard deviation over the runs, like tester.py does
+    """
+    set_reproducible()
+    classifier.sequence_encoder = encoder
+    runs = list()
+    for i in range(n):
+        runs.append(benchmark_run(classifier, trainfile, devfile))
+        # start each run from an empty graph: otherwise every model (and its copy of the frozen
+        # embedding matrix) stays in the session and slows down the encoders benchmarked last
+        K.clear_session()
+    runs = np.array(runs)
+    devaccs = runs[:, 0]
+    train_time, vectorize_time, predict_time = runs[:, 1:].mean(axis=0)
+    return (np.mean(devaccs), np.std(devaccs), train_time, vectorize_time, predict_time)
+
+
+if __name__ == "__main__":
+    datadir = "../data/"
+    trainfile = datadir + "frdataset1_train.csv"
+    devfile = datadir + "frdataset1_dev.csv"
+    benchmarks = [
+        (classifier_mixed, ['gru', 'pool', 'conv']),
+        (classifier_embeddings, ['lstm', 'pool', 'conv']),
+    ]
+    n = 5
+    results = []
+    for module, encoders in benchmarks:
+        # the embedding model is loaded once per classifier and reused for every encoder
+        classifier = module.Classifier()
+        for encoder in encoders:
+            res = benchmark_encoder(classifier, encoder, trainfile, devfile, n)
+            results.append((module.__name__, encoder) + res)
+
+    print()
+    print("%-22s %-6s %15s %10s %14s %14s" % ("Classifier", "Enc.", "Dev Acc.", "Train (s)", "Vectorize (ms)", "Predict (ms)"))
+    for name, encoder, devacc, devstd, train_time, vectorize_time, predict_time in results:
+        print("%-22s %-6s %8.2f (%.2f) %10.2f %14.3f %14.3f" % (
+            name, encoder, devacc, devstd, train_time, vectorize_time, predict_time))
+    print("(mean over %d runs, dev acc. std in parentheses, vectorize and predict times are per document)" % n)
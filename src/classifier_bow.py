@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import regex as re
 import sys
 import fr_core_news_sm
 
@@ -14,7 +13,8 @@ from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 
 import spacy
 
-from datatools import load_dataset
+from datatools import load_dataset, normalize_text, deduplicate
+from prediction_cache import PredictionCache
 
 np.random.seed(15)
 nlp = fr_core_news_sm.load()
@@ -29,6 +29,9 @@ class Classifier:
         self.labelset = None
         self.label_binarizer = LabelBinarizer()
         self.model = None
+        # bumped at each training so that cached predictions of older models are never served
+        self.model_version = 0
+        self.prediction_cache = PredictionCache(max_size=10000, ttl=None)
         self.epochs = 150
         self.batchsize = 32
         self.max_features = 8000
@@ -55,23 +58,14 @@ class Classifier:
         return load_model(self.model_file)
 
     def clean_input(self, input_text):
-        """general text preprocessing before tokenization"""
-        # REMOVE QUOTES
-        clean_text = re.sub(r'[\"\']', '', input_text)
-
-        # REMOVE LEADING EDGE SPACING
-        clean_text = re.sub(r'^ +','', clean_text)
-
-        # LOWERCASE
-        clean_text = clean_text.lower()
-
-        return input_text
+        """general text preprocessing before tokenization: remove double quotes and leading spaces"""
+        return normalize_text(input_text)
 
     def tokenize(self, input_text):
         """Customized tokenizer.
         Here you can add other linguistic processing and generate more normalized features
         """
-        doc = nlp(self.clean_input(input_text))
+        doc = nlp(input_text)
         tokens = list()
         for sent in doc.sents:
             for token in sent:
@@ -108,9 +102,15 @@ class Classifier:
         return model
 
     def vectorize(self, texts):
-        vectors = self.vectorizer.transform(texts).toarray()
+        return self.vectorize_clean([self.clean_input(text) for text in texts])
+
+    def vectorize_clean(self, texts):
+        """Vectorize texts already normalized with clean_input"""
+        # parse each distinct text only once, then scatter the vectors back in the input order
+        unique_texts, inverse = deduplicate(texts)
+        vectors = self.vectorizer.transform(unique_texts).toarray()
         # print(self.vectorizer.get_feature_names())
-        return vectors
+        return vectors[inverse]
 
     def train_on_data(self, texts, labels, valtexts=None, vallabels=None):
         """Train the model using the list of text examples together with their true (correct) labels"""
@@ -120,9 +120,10 @@ class Classifier:
         self.labelset = set(self.label_binarizer.classes_)
         print("LABELS: %s" % self.labelset)
         # build the feature index (unigram of words, bi-grams etc.)  using the training data
-        self.vectorizer.fit(texts)
+        self.vectorizer.fit([self.clean_input(text) for text in texts])
         # create a model to train
         self.model = self.create_model()
+        self.model_version += 1
         # for each text example, build its vector representation
         X_train = self.vectorize(texts)
 
@@ -149,13 +150,28 @@ class Classifier:
     def predict_on_X(self, X):
         return self.model.predict(X)
 
+    def predict_proba_on_data(self, texts):
+        """Returns the class probability vectors for a list of input texts.
+        Texts already scored by the current model are served from the prediction cache
+        without being parsed or scored again
+        """
+        # normalize once: the cache is keyed by the text the model actually reads
+        texts = [self.clean_input(text) for text in texts]
+        Y = [self.prediction_cache.get(text, self.model_version) for text in texts]
+        missing = [i for i, y in enumerate(Y) if y is None]
+        if missing:
+            X = self.vectorize_clean([texts[i] for i in missing])
+            # get the predicted output vectors: each vector will contain a probability for each class label
+            for i, y in zip(missing, self.model.predict(X)):
+                Y[i] = y.copy()
+                self.prediction_cache.put(texts[i], self.model_version, Y[i])
+        return np.array(Y)
+
     def predict_on_data(self, texts):
         """Use this classifier model to predict class labels for a list of input texts.
         Returns the list of predicted labels
         """
-        X = self.vectorize(texts)
-        # get the predicted output vectors: each vector will contain a probability for each class label
-        Y = self.model.predict(X)
+        Y = self.predict_proba_on_data(texts)
         # from the output probability vectors, get the labels that got the best probability scores
         return self.label_binarizer.inverse_transform(Y)
 
@@ -2,18 +2,19 @@ import sys
 import spacy
 import fr_core_news_sm
 import numpy as np
-import regex as re
 
 from gensim.models import KeyedVectors as kv
 
 from keras.layers import Input, Dense, Dropout, Activation, BatchNormalization
 from keras.layers import LSTM, GRU, Embedding
-from keras.models import Sequential
+from keras.models import Model
 from keras import optimizers
 from keras.callbacks import EarlyStopping
 from keras.preprocessing.sequence import pad_sequences
 
-from datatools import load_dataset
+from datatools import load_dataset, normalize_text, deduplicate
+from prediction_cache import PredictionCache
+from encoders import masked_pooling, conv_pooling
 
 from sklearn.preprocessing import LabelBinarizer
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
@@ -34,9 +35,14 @@ class Classifier:
         self.labelset = None
         self.label_binarizer = LabelBinarizer()
         self.model = None
+        # bumped at each training so that cached predictions of older models are never served
+        self.model_version = 0
+        self.prediction_cache = PredictionCache(max_size=10000, ttl=None)
         self.epochs = 20
         self.sequence_length = 25 # None for auto length
         self.batchsize = 32
+        # encoder for the word embeddings: 'lstm', 'pool' (masked mean/max) or 'conv'
+        self.sequence_encoder = 'lstm'
 
         # load the pre compiled embedding model from the disk
         self.load_embedding_model()
@@ -60,23 +66,14 @@ class Classifier:
             self.stopwords = fp.read().splitlines()
 
     def clean_input(self, input_text):
-        """general text preprocessing before tokenization"""
-        # REMOVE QUOTES
-        clean_text = re.sub(r'[\"\']', '', input_text)
-
-        # REMOVE LEADING EDGE SPACING
-        clean_text = re.sub(r'^ +','', clean_text)
-
-        # LOWERCASE
-        clean_text = clean_text.lower()
-
-        return input_text
+        """general text preprocessing before tokenization: remove double quotes and leading spaces"""
+        return normalize_text(input_text)
 
     def tokenize(self, text):
         """Customized tokenizer.
         Here you can add other linguistic processing and generate more normalized features
         """
-        doc = nlp(self.clean_input(text))
+        doc = nlp(text)
         tokens = list()
         for sent in doc.sents:
             for token in sent:
@@ -86,11 +83,17 @@ class Classifier:
 
     def vectorize(self, texts):
         """get the vectorized representation for the texts"""
+        return self.vectorize_clean([self.clean_input(text) for text in texts])
+
+    def vectorize_clean(self, texts):
+        """get the vectorized representation for texts already normalized with clean_input"""
         all_indices = list()
         total_tokens = 0
         skipped_tokens = 0
 
-        for text in texts:
+        # parse each distinct text only once, the rows are scattered back in the input order
+        unique_texts, inverse = deduplicate(texts)
+        for text in unique_texts:
             doc_indices = list()
             tokens = self.tokenize(text)
             for t in tokens:
@@ -103,32 +106,43 @@ class Classifier:
             all_indices.append(doc_indices)
 
         print("Vectorizer skipped %d tokens for a total of %d tokens" % (skipped_tokens, total_tokens))
-        return pad_sequences(all_indices, maxlen=self.sequence_length, value=0)
+        return pad_sequences(all_indices, maxlen=self.sequence_length, value=0)[inverse]
+
+    def encode_sequence(self, embedded, token_ids):
+        """Encode the embedded tokens into a fixed size vector with the selected sequence encoder"""
+        if self.sequence_encoder == 'lstm':
+            return LSTM(280, dropout=0.3, recurrent_dropout=0.2, activation='relu')(embedded)
+        if self.sequence_encoder == 'pool':
+            return masked_pooling(embedded, token_ids)
+        if self.sequence_encoder == 'conv':
+            return conv_pooling(embedded, token_ids, filters=128, kernel_size=3)
+        raise ValueError("Unknown sequence encoder: %s" % self.sequence_encoder)
 
     def create_model(self):
         """Create a neural network model and return it.
         Here you can modify the architecture of the model (network type, number of layers, number of neurones)
         and its parameters"""
 
-        model = Sequential()
+        input = Input((self.sequence_length,))
+        layer = input
 
         weights = self.embedding_model.vectors
-        embedding_layer = Embedding(
+        layer = Embedding(
             input_dim=weights.shape[0],
             output_dim=weights.shape[1],
             weights=[weights],
-            mask_zero= True,
+            # only the recurrent encoder consumes the keras mask, the others build their own
+            mask_zero=self.sequence_encoder == 'lstm',
             trainable=False
-        )
-
-        model.add(embedding_layer)
+        )(layer)
 
-        model.add(LSTM(280, dropout=0.3, recurrent_dropout=0.2, activation='relu'))
-        model.add(Dense(32, activation='relu'))
-        model.add(Dense(64, activation='relu'))
+        layer = self.encode_sequence(layer, input)
+        layer = Dense(32, activation='relu')(layer)
+        layer = Dense(64, activation='relu')(layer)
 
-        model.add(Dense(len(self.labelset), activation="softmax"))
+        output = Dense(len(self.labelset), activation="softmax")(layer)
 
+        model = Model(inputs=input, outputs=output)
         model.summary()
 
         # compile model
@@ -150,6 +164,7 @@ class Classifier:
         # self.vectorizer.fit(texts)
         # create a model to train
         self.model = self.create_model()
+        self.model_version += 1
         # for each text example, build its vector representation
         X_train = self.vectorize(texts)
         my_callbacks = []
@@ -173,13 +188,28 @@ class Classifier:
             verbose=1
         )
 
+    def predict_proba_on_data(self, texts):
+        """Returns the class probability vectors for a list of input texts.
+        Texts already scored by the current model are served from the prediction cache
+        without being parsed or scored again
+        """
+        # normalize once: the cache is keyed by the text the model actually reads
+        texts = [self.clean_input(text) for text in texts]
+        Y = [self.prediction_cache.get(text, self.model_version) for text in texts]
+        missing = [i for i, y in enumerate(Y) if y is None]
+        if missing:
+            X = self.vectorize_clean([texts[i] for i in missing])
+            # get the predicted output vectors: each vector will contain a probability for each class label
+            for i, y in zip(missing, self.model.predict(X)):
+                Y[i] = y.copy()
+                self.prediction_cache.put(texts[i], self.model_version, Y[i])
+        return np.array(Y)
+
     def predict_on_data(self, texts):
         """Use this classifier model to predict class labels for a list of input texts.
         Returns the list of predicted labels
         """
-        X = self.vectorize(texts)
-        # get the predicted output vectors: each vector will contain a probability for each class label
-        Y = self.model.predict(X)
+        Y = self.predict_proba_on_data(texts)
         # from the output probability vectors, get the labels that got the best probability scores
         return self.label_binarizer.inverse_transform(Y)
 
@@ -1,4 +1,5 @@
 import sys
+import pickle
 import spacy
 import fr_core_news_sm
 import numpy as np
@@ -7,12 +8,14 @@ from gensim.models import KeyedVectors as kv
 
 from keras.layers import Input, Dense, Dropout, Activation, Concatenate
 from keras.layers import LSTM, GRU, Embedding, Bidirectional
-from keras.models import Model
+from keras.models import Model, load_model
 from keras import optimizers
 from keras.callbacks import EarlyStopping
 from keras.preprocessing.sequence import pad_sequences
 
-from datatools import load_dataset
+from datatools import load_dataset, normalize_text, deduplicate
+from prediction_cache import PredictionCache
+from encoders import masked_pooling, conv_pooling
 
 from sklearn.preprocessing import LabelBinarizer
 from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
@@ -33,20 +36,22 @@ class Classifier:
         self.labelset = None
         self.label_binarizer = LabelBinarizer()
         self.model = None
+        # bumped at each training so that cached predictions of older models are never served
+        self.model_version = 0
+        self.prediction_cache = PredictionCache(max_size=10000, ttl=None)
         self.epochs = 25
         self.sequence_length = 35 # None for auto length
         self.batchsize = 32
         self.max_features = 9000
+        # encoder for the word embeddings branch: 'gru', 'pool' (masked mean/max) or 'conv'
+        self.sequence_encoder = 'gru'
 
+        # the documents are parsed once for both inputs, the vectorizer receives the BOW tokens
+        # through its analyzer (which builds the unigrams and bi-grams itself)
         self.vectorizer = CountVectorizer(
             max_features=self.max_features,
-            strip_accents=None,
-            analyzer='word',
-            tokenizer=self.tokenize_bow,
-            stop_words=None,
-            ngram_range=(1, 2),
-            binary=False,
-            preprocessor=None
+            analyzer=self.analyze_bow,
+            binary=False
         )
 
         # load the pre compiled embedding model from the disk
@@ -70,14 +75,43 @@ class Classifier:
         with open(self.stopwords_file) as fp:
             self.stopwords = fp.read().splitlines()
 
+    def clean_input(self, input_text):
+        """general text preprocessing before tokenization: remove double quotes and leading spaces"""
+        return normalize_text(input_text)
+
+    def save(self, path):
+        """Save the keras model, the BOW vocabulary and the labels next to each other"""
+        self.model.save(path + '.h5')
+        with open(path + '.pkl', 'wb') as fp:
+            pickle.dump({
+                'vocabulary': self.vectorizer.vocabulary_,
+                'classes': self.label_binarizer.classes_,
+                'sequence_encoder': self.sequence_encoder
+            }, fp)
+
+    def load(self, path):
+        """Load a classifier saved with save() (the embedding model must be the same)"""
+        with open(path + '.pkl', 'rb') as fp:
+            state = pickle.load(fp)
+        # the vectorizer tokenizes with our bound method, only its vocabulary is saved
+        self.vectorizer.vocabulary_ = state['vocabulary']
+        self.label_binarizer.fit(state['classes'])
+        self.labelset = set(self.label_binarizer.classes_)
+        self.sequence_encoder = state['sequence_encoder']
+        self.model = load_model(path + '.h5')
+        self.model_version += 1
+
     def features_count(self):
         return len(self.vectorizer.vocabulary_)
 
-    def tokenize_embeddings(self, text):
+    def parse(self, texts):
+        """Parse the texts with spaCy, the documents feed both tokenizers"""
+        return list(nlp.pipe(texts))
+
+    def tokenize_embeddings(self, doc):
         """Customized tokenizer.
         Here you can add other linguistic processing and generate more normalized features
         """
-        doc = nlp(text)
         tokens = list()
         for sent in doc.sents:
             for token in sent:
@@ -85,15 +119,15 @@ class Classifier:
                     tokens.append(token.text.lower().strip())
         return tokens
 
-    def vectorize_embeddings(self, texts):
-        """Vectorize the texts fot the word embeddings input"""
+    def vectorize_embeddings(self, docs):
+        """Vectorize the parsed texts fot the word embeddings input"""
         all_indices = list()
         total_tokens = 0
         skipped_tokens = 0
 
-        for text in texts:
+        for doc in docs:
             doc_indices = list()
-            tokens = self.tokenize_embeddings(text)
+            tokens = self.tokenize_embeddings(doc)
             for t in tokens:
                 total_tokens += 1
                 if t in self.embedding_model:
@@ -105,25 +139,50 @@ class Classifier:
         print("Vectorizer skipped %d tokens for a total of %d tokens" % (skipped_tokens, total_tokens))
         return pad_sequences(all_indices, maxlen=self.sequence_length, value=0)
 
-    def tokenize_bow(self, text):
-        """tokenize the text for the BOW representation"""
-        doc = nlp(text)
+    def tokenize_bow(self, doc):
+        """tokenize the parsed text for the BOW representation"""
         tokens = list()
         for sent in doc.sents:
             for token in sent:
                 if token.pos_ == 'NUM':
                     tokens.append('#NUM#')
-                elif token.pos_ not in ["PUNCT", "SYM", "X"] and token.text not in self.stopwords:
+                elif token.pos_ not in ["PUNCT", "SYM", "X"] and token.lower_ not in self.stopwords:
                     tokens.append(token.lemma_.lower().strip())
         return tokens
 
-    def vectorize_bow(self, texts):
-        """Vectorize the texts for the BOW representation"""
-        return self.vectorizer.transform(texts).toarray()
+    def analyze_bow(self, tokens):
+        """BOW vectorizer analyzer: returns the unigrams and bi-grams of the tokens"""
+        return tokens + [' '.join(bigram) for bigram in zip(tokens, tokens[1:])]
+
+    def vectorize_bow(self, docs):
+        """Vectorize the parsed texts for the BOW representation"""
+        return self.vectorizer.transform([self.tokenize_bow(doc) for doc in docs]).toarray()
 
     def vectorize(self, texts):
         """Vectorize the texts and returns the two inputs for the model"""
-        return [self.vectorize_embeddings(texts), self.vectorize_bow(texts)]
+        return self.vectorize_clean([self.clean_input(text) for text in texts])
+
+    def vectorize_clean(self, texts):
+        """Vectorize texts already normalized with clean_input, returns the two inputs for the model"""
+        # parse each distinct text only once, then scatter the vectors back in the input order
+        unique_texts, inverse = deduplicate(texts)
+        X_embeddings, X_bow = self.vectorize_docs(self.parse(unique_texts))
+        return [X_embeddings[inverse], X_bow[inverse]]
+
+    def vectorize_docs(self, docs):
+        """Vectorize the parsed texts, returns the two inputs for the model"""
+        return [self.vectorize_embeddings(docs), self.vectorize_bow(docs)]
+
+    def encode_sequence(self, embedded, token_ids):
+        """Encode the embedded tokens into a fixed size vector with the selected sequence encoder"""
+        if self.sequence_encoder == 'gru':
+            # return GRU(280, dropout=0.5, recurrent_dropout=0.3, activation='relu', return_sequences=True)(embedded)
+            return GRU(240, dropout=0.4, recurrent_dropout=0.3, activation='relu')(embedded)
+        if self.sequence_encoder == 'pool':
+            return masked_pooling(embedded, token_ids)
+        if self.sequence_encoder == 'conv':
+            return conv_pooling(embedded, token_ids, filters=128, kernel_size=3)
+        raise ValueError("Unknown sequence encoder: %s" % self.sequence_encoder)
 
     def create_model(self):
         """Create a neural network model and return it.
@@ -139,12 +198,12 @@ class Classifier:
             input_dim=weights.shape[0],
             output_dim=weights.shape[1],
             weights=[weights],
-            mask_zero= True,
+            # only the recurrent encoder consumes the keras mask, the others build their own
+            mask_zero=self.sequence_encoder == 'gru',
             trainable=False
         )(branch1)
 
-        # branch1 = GRU(280, dropout=0.5, recurrent_dropout=0.3, activation='relu', return_sequences=True)(branch1)
-        branch1 = GRU(240, dropout=0.4, recurrent_dropout=0.3, activation='relu')(branch1)
+        branch1 = self.encode_sequence(branch1, input1)
         branch1 = Dense(16, activation='relu')(branch1)
 
         # Second input (bag of words)
@@ -178,11 +237,13 @@ class Classifier:
         self.labelset = set(self.label_binarizer.classes_)
         print('LABELS: %s' % self.labelset)
         # build the feature index (unigram of words, bi-grams etc.)  using the training data
-        self.vectorizer.fit(texts)
+        docs = self.parse([self.clean_input(text) for text in texts])
+        self.vectorizer.fit([self.tokenize_bow(doc) for doc in docs])
         # create a model to train
         self.model = self.create_model()
+        self.model_version += 1
         # for each text example, build its vector representation
-        X_train = self.vectorize(texts)
+        X_train = self.vectorize_docs(docs)
         my_callbacks = []
         early_stopping = EarlyStopping(monitor='val_loss', min_delta=0, patience=3, verbose=0, mode='auto', baseline=None)
         my_callbacks.append(early_stopping)
@@ -204,13 +265,28 @@ class Classifier:
             verbose=1
         )
 
+    def predict_proba_on_data(self, texts):
+        """Returns the class probability vectors for a list of input texts.
+        Texts already scored by the current model are served from the prediction cache
+        without being parsed or scored again
+        """
+        # normalize once: the cache is keyed by the text the model actually reads
+        texts = [self.clean_input(text) for text in texts]
+        Y = [self.prediction_cache.get(text, self.model_version) for text in texts]
+        missing = [i for i, y in enumerate(Y) if y is None]
+        if missing:
+            X = self.vectorize_clean([texts[i] for i in missing])
+            # get the predicted output vectors: each vector will contain a probability for each class label
+            for i, y in zip(missing, self.model.predict(X)):
+                Y[i] = y.copy()
+                self.prediction_cache.put(texts[i], self.model_version, Y[i])
+        return np.array(Y)
+
     def predict_on_data(self, texts):
         """Use this classifier model to predict class labels for a list of input texts.
         Returns the list of predicted labels
         """
-        X = self.vectorize(texts)
-        # get the predicted output vectors: each vector will contain a probability for each class label
-        Y = self.model.predict(X)
+        Y = self.predict_proba_on_data(texts)
         # from the output probability vectors, get the labels that got the best probability scores
         return self.label_binarizer.inverse_transform(Y)
 
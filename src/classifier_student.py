@@ -0,0 +1,162 @@
+import pickle
+import numpy as np
+
+from keras.layers import Input, Dense
+from keras.models import load_model, Model
+from keras import optimizers
+from keras.callbacks import EarlyStopping
+
+from sklearn.preprocessing import LabelBinarizer
+from sklearn.feature_extraction.text import CountVectorizer
+
+from datatools import load_dataset, normalize_text
+
+np.random.seed(15)
+
+def preprocess(text):
+    """normalize and lowercase the text (module level so that the vectorizer can be pickled)"""
+    return normalize_text(text).lower()
+
+class Classifier:
+    """Lightweight linear BOW classifier, trained on the soft probabilities of a teacher model (see distill.py).
+    It does not use spaCy: the texts are normalized then split with a regular expression
+    """
+
+    def __init__(self, max_features=8000):
+        self.stopwords_file = '../resources/fr_stopwords.csv'
+        self.stopwords = []
+        self.labelset = None
+        self.label_binarizer = LabelBinarizer()
+        self.model = None
+        self.epochs = 50
+        self.batchsize = 64
+        self.max_features = max_features
+        self.load_stopwords()
+        # create the vectorizer: it is pickled with the model, which works because preprocess is defined at module level
+        self.vectorizer = CountVectorizer(
+            max_features=self.max_features,
+            strip_accents=None,
+            analyzer='word',
+            token_pattern=r'(?u)\b\w+\b',
+            stop_words=None,
+            ngram_range=(1, 2),
+            binary=False,
+            preprocessor=preprocess
+        )
+        # the stopwords go through the same preprocessing and tokenization as the texts, or entries like "j'" never match
+        tokenize = self.vectorizer.build_tokenizer()
+        self.vectorizer.set_params(stop_words=sorted({t for w in self.stopwords for t in tokenize(preprocess(w))}))
+
+    def load_stopwords(self):
+        """load our custom list of stopwords"""
+        with open(self.stopwords_file) as fp:
+            self.stopwords = fp.read().splitlines()
+
+    def save(self, path):
+        """Save the keras model and the fitted vectorizer / labels next to each other"""
+        self.model.save(path + '.h5')
+        with open(path + '.pkl', 'wb') as fp:
+            pickle.dump({'vectorizer': self.vectorizer, 'classes': self.label_binarizer.classes_}, fp)
+
+    def load(self, path):
+        """Load a student saved with save()"""
+        self.model = load_model(path + '.h5')
+        with open(path + '.pkl', 'rb') as fp:
+            state = pickle.load(fp)
+        self.vectorizer = state['vectorizer']
+        self.label_binarizer.fit(state['classes'])
+        self.labelset = set(self.label_binarizer.classes_)
+
+    def feature_count(self):
+        return len(self.vectorizer.vocabulary_)
+
+    def create_model(self):
+        """Create the (linear) student model and return it"""
+        input = Input((self.feature_count(),))
+        output = Dense(len(self.labelset), activation='softmax')(input)
+        model = Model(inputs=input, outputs=output)
+        # the soft targets are probability vectors: the crossentropy is computed against the full distribution
+        model.compile(
+            optimizer=optimizers.Adam(),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        model.summary()
+        return model
+
+    def vectorize(self, texts):
+        # keep the sparse matrix: keras densifies it batch by batch, so large corpora fit in memory
+        return self.vectorizer.transform(texts)
+
+    def train_on_soft_labels(self, texts, probs, classes, valtexts=None, valprobs=None):
+        """Train the model on the class probabilities predicted by a teacher.
+        'classes' gives the label of each column of 'probs' (the teacher's label_binarizer.classes_).
+        Without validation data, 10% of the training texts are held out for the early stopping
+        """
+        self.label_binarizer.fit(classes)
+        self.labelset = set(self.label_binarizer.classes_)
+        print("LABELS: %s" % self.labelset)
+        self.vectorizer.fit(texts)
+        self.model = self.create_model()
+        X_train = self.vectorize(texts)
+
+        early_stopping = EarlyStopping(monitor='val_loss', min_delta=0, patience=3, verbose=0, mode='auto', baseline=None)
+        if valtexts is not None and valprobs is not None:
+            valdata = (self.vectorize(valtexts), np.asarray(valprobs))
+            valsplit = 0.
+        else:
+            valdata = None
+            valsplit = 0.1
+
+        self.model.fit(
+            X_train, np.asarray(probs),
+            epochs=self.epochs,
+            batch_size=self.batchsize,
+            callbacks=[early_stopping],
+            validation_data=valdata,
+            validation_split=valsplit,
+            verbose=2
+        )
+
+    def train_on_data(self, texts, labels, valtexts=None, vallabels=None):
+        """Train the model on the true (hard) labels"""
+        label_binarizer = LabelBinarizer()
+        Y_train = label_binarizer.fit_transform(labels)
+        if valtexts is not None and vallabels is not None:
+            Y_val = label_binarizer.transform(vallabels)
+        else:
+            Y_val = None
+        self.train_on_soft_labels(texts, Y_train, label_binarizer.classes_, valtexts, Y_val)
+
+    def predict_proba_on_data(self, texts):
+        """Returns the class probability vectors for a list of input texts"""
+        return self.model.predict(self.vectorize(texts))
+
+    def predict_on_data(self, texts):
+        """Use this classifier model to predict class labels for a list of input texts.
+        Returns the list of predicted labels
+        """
+        Y = self.predict_proba_on_data(texts)
+        return self.label_binarizer.inverse_transform(Y)
+
+    ####################################################################################################
+    # IMPORTANT: ne pas changer le nom et les paramètres des deux méthode suivantes: train et predict
+    ###################################################################################################
+    def train(self, trainfile, valfile=None):
+        df = load_dataset(trainfile)
+        texts = df['text']
+        labels = df['polarity']
+        if valfile:
+            valdf = load_dataset(valfile)
+            valtexts = valdf['text']
+            vallabels = valdf['polarity']
+        else:
+            valtexts = vallabels = None
+        self.train_on_data(texts, labels, valtexts, vallabels)
+
+    def predict(self, datafile):
+        """Use this classifier model to predict class labels for a list of input texts.
+        Returns the list of predicted labels
+        """
+        items = load_dataset(datafile)
+        return self.predict_on_data(items['text'])
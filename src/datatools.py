@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 
+import numpy as np
 import pandas as pd
+import regex as re
 from sklearn.model_selection import StratifiedShuffleSplit
 
+# only the double quotes: the apostrophes mark the french elisions (l'eau, qu'est) that spaCy splits
+QUOTES_RE = re.compile(r'"')
+LEADING_SPACES_RE = re.compile(r'^ +')
+
 def load_dataset(filename):
     """ Download the date: list of texts with scores."""
     headers = ['polarity', 'text']
@@ -12,6 +18,27 @@ def load_dataset(filename):
     # return the list of rows : row = label and text
     return sentences
 
+def iter_dataset_chunks(filename, chunksize):
+    """Read the dataset by chunks of 'chunksize' rows"""
+    headers = ['polarity', 'text']
+    return pd.read_csv(filename, encoding="utf-8", sep='\t', names=headers, chunksize=chunksize)
+
+def normalize_text(text):
+    """Normalize a text: remove double quotes and leading spaces.
+    The case is kept since it helps spaCy's tagging, the tokenizers lowercase the tokens themselves
+    """
+    text = QUOTES_RE.sub('', text)
+    return LEADING_SPACES_RE.sub('', text)
+
+def deduplicate(texts):
+    """Collapse the texts to their unique values, in order of first occurrence.
+    Returns the unique texts and, for each input text, the index of its unique value
+    (so that unique_values[inverse] restores the original order)
+    """
+    index = dict()
+    inverse = [index.setdefault(text, len(index)) for text in texts]
+    return list(index), np.array(inverse, dtype=int)
+
 def save_datarows(datarows, filename):
     with open(filename, 'w', encoding= 'UTF-8', newline='\n') as f:
         for d in datarows:
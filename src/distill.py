@@ -0,0 +1,79 @@
+import sys
+import time
+import numpy as np
+
+import classifier_student
+from classifier_mixed import Classifier as Teacher
+from datatools import load_dataset
+from tester import set_reproducible, eval_list
+
+
+def score_corpus(teacher, texts, chunksize=1000):
+    """Get the teacher's class probabilities for every text of the (unlabeled) corpus"""
+    probs = []
+    for start in range(0, len(texts), chunksize):
+        probs.append(teacher.predict_proba_on_data(texts[start:start+chunksize]))
+        print("  Scored %d/%d documents" % (min(start + chunksize, len(texts)), len(texts)))
+    return np.concatenate(probs)
+
+
+def timed_predict(classifier, texts):
+    """Predict the labels of the texts, returns the labels and the throughput in docs/s"""
+    start_time = time.perf_counter()
+    labels = classifier.predict_on_data(texts)
+    return labels, len(texts) / (time.perf_counter() - start_time)
+
+
+def distill(teacher, corpus_texts, corpus_probs, max_features):
+    """Train a student with the given number of features on the teacher's soft probabilities"""
+    set_reproducible()
+    student = classifier_student.Classifier(max_features=max_features)
+    student.train_on_soft_labels(corpus_texts, corpus_probs, teacher.label_binarizer.classes_)
+    return student
+
+
+if __name__ == "__main__":
+    set_reproducible()
+    datadir = "../data/"
+    trainfile = datadir + "frdataset1_train.csv"
+    devfile = datadir + "frdataset1_dev.csv"
+    # the unlabeled corpus uses the dataset format, its polarity column is ignored
+    corpusfile = sys.argv[1] if len(sys.argv) > 1 else trainfile
+    # student sizes to compare (throughput / accuracy operating points)
+    student_features = [2000, 8000, 20000]
+
+    print("1. Training the teacher...")
+    teacher = Teacher()
+    teacher.train(trainfile, devfile)
+    teacher.save(datadir + "teacher")
+
+    print("2. Scoring the corpus with the teacher...")
+    corpus_texts = list(load_dataset(corpusfile)['text'])
+    corpus_probs = score_corpus(teacher, corpus_texts)
+
+    devdf = load_dataset(devfile)
+    devtexts = list(devdf['text'])
+    # do not let the prediction cache inflate the teacher's throughput
+    teacher.prediction_cache.clear()
+    tlabels, teacher_speed = timed_predict(teacher, devtexts)
+    teacher_acc = eval_list(devdf['polarity'], tlabels)
+
+    print("3. Training the students...")
+    results = []
+    for max_features in student_features:
+        student = distill(teacher, corpus_texts, corpus_probs, max_features)
+        student.save(datadir + "student_%d" % max_features)
+        slabels, student_speed = timed_predict(student, devtexts)
+        results.append((
+            max_features,
+            eval_list(tlabels, slabels),
+            eval_list(devdf['polarity'], slabels),
+            student_speed
+        ))
+
+    print()
+    print("Teacher: Dev Acc. %.2f, %.1f docs/s" % (teacher_acc, teacher_speed))
+    print("%-10s %10s %9s %9s %9s" % ("Features", "Agreement", "Dev Acc.", "docs/s", "Speedup"))
+    for max_features, agreement, devacc, student_speed in results:
+        print("%-10d %10.2f %9.2f %9.1f %8.1fx" % (
+            max_features, agreement, devacc, student_speed, student_speed / teacher_speed))
@@ -0,0 +1,42 @@
+"""Non recurrent sequence encoders for the word embeddings branch.
+
+These encoders turn a padded sequence of embedded tokens into a fixed size vector
+without iterating over the time steps, which makes them much faster than GRU/LSTM
+cells on CPU. Padding tokens (index 0, as produced by pad_sequences) are masked out.
+"""
+from keras import backend as K
+from keras.layers import Lambda, Conv1D, Concatenate
+
+
+def padding_mask(token_ids):
+    """Build a (batch, steps, 1) float mask: 1 for real tokens, 0 for padding"""
+    return Lambda(lambda x: K.expand_dims(K.cast(K.not_equal(x, 0), K.floatx()), axis=-1))(token_ids)
+
+
+def masked_mean(sequence, mask):
+    """Average the sequence vectors over the non padded time steps"""
+    return Lambda(
+        lambda t: K.sum(t[0] * t[1], axis=1) / K.maximum(K.sum(t[1], axis=1), 1.)
+    )([sequence, mask])
+
+
+def masked_max(sequence, mask):
+    """Max over the non padded time steps (zeros for empty sequences)"""
+    return Lambda(
+        lambda t: K.max(t[0] - (1. - t[1]) * 1e9, axis=1) * K.max(t[1], axis=1)
+    )([sequence, mask])
+
+
+def masked_pooling(embedded, token_ids):
+    """Concatenate the masked mean and max pooling of the embedded tokens"""
+    mask = padding_mask(token_ids)
+    return Concatenate(axis=-1)([masked_mean(embedded, mask), masked_max(embedded, mask)])
+
+
+def conv_pooling(embedded, token_ids, filters=128, kernel_size=3):
+    """Small 1-D convolution over the embedded tokens followed by a masked max pooling"""
+    mask = padding_mask(token_ids)
+    # zero the padding vectors so they do not leak into the neighbouring windows
+    sequence = Lambda(lambda t: t[0] * t[1])([embedded, mask])
+    sequence = Conv1D(filters, kernel_size, padding='same', activation='relu')(sequence)
+    return masked_max(sequence, mask)
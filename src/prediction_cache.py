@@ -0,0 +1,51 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Bounded LRU cache of prediction vectors, keyed by the model input text and the model version.
+    The texts must be given as the model reads them (after clean_input)
+    """
+
+    def __init__(self, max_size=10000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl # entry lifetime in seconds, None for no expiry
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text, model_version):
+        """hash of the model version and the text"""
+        data = "%s\t%s" % (model_version, text)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get(self, text, model_version):
+        """Returns the cached prediction for the text, or None if it is missing or expired"""
+        key = self.key(text, model_version)
+        entry = self.entries.get(key)
+        if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, text, model_version, prediction):
+        """Store the prediction, evicting the least recently used entries if the cache is full"""
+        key = self.key(text, model_version)
+        self.entries[key] = (time.monotonic(), prediction)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}